@@ -1,7 +1,15 @@
 import numpy as np
 cimport numpy as np
 from libc.stdlib cimport malloc, free
-from scipy.special import factorial2 as fact2 
+from libc.math cimport pow, sqrt
+
+# odd double factorials (2k-1)!! indexed by Cartesian angular momentum k,
+# filled once at import so normalize avoids scipy.special.factorial2
+cdef double F2[32]
+cdef int _k
+F2[0] = 1.0
+for _k in range(1,32):
+    F2[_k] = F2[_k-1]*(2*_k - 1)
 
 cdef class Basis:
     """ Cython extension class to define primitive Gaussian basis functions"""
@@ -93,29 +101,35 @@ cdef class Basis:
            normalizes the contracted functions. Both steps are required,
            though I could make it one step if need be.
         """
-        l = self.shell[0]
-        m = self.shell[1]
-        n = self.shell[2]
-        L = l + m + n
+        cdef:
+            long ia, ib
+            long l = self.shell[0]
+            long m = self.shell[1]
+            long n = self.shell[2]
+            long L = l + m + n
+            double fact, prefactor
+            double N = 0.0
+        # double factorials only depend on the shell, not the primitive
+        if max(l,m,n) >= 32:
+            raise ValueError("Angular momentum %d too high for normalization" % max(l,m,n))
+        fact = F2[l]*F2[m]*F2[n]
+
         # normalize primitives first (PGBFs)
         for ia in range(self.num_exps):
-            self.norm[ia] = np.sqrt(np.power(2,2*(l+m+n)+1.5)*
-                            np.power(self.exps[ia],l+m+n+1.5)/
-                            fact2(2*l-1)/fact2(2*m-1)/
-                            fact2(2*n-1)/np.power(np.pi,1.5))
+            self.norm[ia] = sqrt(pow(2,2*L+1.5)*
+                            pow(self.exps[ia],L+1.5)/
+                            fact/pow(pi,1.5))
 
         # now normalize the contracted basis functions (CGBFs)
         # Eq. 1.44 of Valeev integral whitepaper
-        prefactor = np.power(np.pi,1.5)*\
-            fact2(2*l - 1)*fact2(2*m - 1)*fact2(2*n - 1)/np.power(2.0,L)
+        prefactor = pow(pi,1.5)*fact/pow(2.0,L)
 
-        N = 0.0
         for ia in range(self.num_exps):
             for ib in range(self.num_exps):
-                N += self.norm[ia]*self.norm[ib]*self.coefs[ia]*self.coefs[ib]/np.power(self.exps[ia] + self.exps[ib],L+1.5)
+                N += self.norm[ia]*self.norm[ib]*self.coefs[ia]*self.coefs[ib]/pow(self.exps[ia] + self.exps[ib],L+1.5)
 
         N *= prefactor
-        N = np.power(N,-0.5)
+        N = pow(N,-0.5)
         for ia in range(self.num_exps):
             self.coefs[ia] *= N
 
@@ -5,7 +5,6 @@ import numpy as np
 cimport numpy as np
 from libc.math cimport exp, pow, tgamma, sqrt, abs
 from scipy.special.cython_special cimport hyp1f1 
-from scipy.special import factorial2 as fact2
 include "util.pxi"
 
 @cython.cdivision(True)
@@ -13,33 +12,51 @@ include "util.pxi"
 @cython.wraparound(False)
 cpdef double S(object a, object b):
     """ Returns overlap """
-    cdef double s = 0.0
-    for ia, ca in enumerate(a.coefs):
-        for ib, cb in enumerate(b.coefs):
-            s += a.norm[ia]*b.norm[ib]*ca*cb*\
-                     overlap(a.exps[ia],a.shell,a.origin,
-                             b.exps[ib],b.shell,b.origin)
+    cdef:
+        double s = 0.0
+        long ia, ib
+        double [:] anorm = a.norm, acoefs = a.coefs, aexps = a.exps, A = a.origin
+        double [:] bnorm = b.norm, bcoefs = b.coefs, bexps = b.exps, B = b.origin
+        long [:] ashell = a.shell, bshell = b.shell
+    for ia in range(acoefs.shape[0]):
+        for ib in range(bcoefs.shape[0]):
+            s += anorm[ia]*bnorm[ib]*acoefs[ia]*bcoefs[ib]*\
+                     overlap(aexps[ia],ashell,A,
+                             bexps[ib],bshell,B)
     return s
 
 @cython.cdivision(True)
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cpdef double Mu(object a, object b, C, str direction):
-    cdef double mu = 0.0
-    for ia, ca in enumerate(a.coefs):
-        for ib, cb in enumerate(b.coefs):
-            mu += a.norm[ia]*b.norm[ib]*ca*cb*\
-                     dipole(a.exps[ia],a.shell,a.origin,
-                     b.exps[ib],b.shell,b.origin,C,direction)
+cpdef double Mu(object a, object b, double [:] C, str direction):
+    cdef:
+        double mu = 0.0
+        long ia, ib
+        double [:] anorm = a.norm, acoefs = a.coefs, aexps = a.exps, A = a.origin
+        double [:] bnorm = b.norm, bcoefs = b.coefs, bexps = b.exps, B = b.origin
+        long [:] ashell = a.shell, bshell = b.shell
+    for ia in range(acoefs.shape[0]):
+        for ib in range(bcoefs.shape[0]):
+            mu += anorm[ia]*bnorm[ib]*acoefs[ia]*bcoefs[ib]*\
+                     dipole(aexps[ia],ashell,A,
+                     bexps[ib],bshell,B,C,direction)
     return mu
 
-def RxDel(a, b, C, direction):
-    l = 0.0
-    for ia, ca in enumerate(a.coefs):
-        for ib, cb in enumerate(b.coefs):
-            l += a.norm[ia]*b.norm[ib]*ca*cb*\
-                     angular(a.exps[ia],a.shell,a.origin,
-                     b.exps[ib],b.shell,b.origin,C,direction)
+@cython.cdivision(True)
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cpdef double RxDel(object a, object b, double [:] C, str direction):
+    cdef:
+        double l = 0.0
+        long ia, ib
+        double [:] anorm = a.norm, acoefs = a.coefs, aexps = a.exps, A = a.origin
+        double [:] bnorm = b.norm, bcoefs = b.coefs, bexps = b.exps, B = b.origin
+        long [:] ashell = a.shell, bshell = b.shell
+    for ia in range(acoefs.shape[0]):
+        for ib in range(bcoefs.shape[0]):
+            l += anorm[ia]*bnorm[ib]*acoefs[ia]*bcoefs[ib]*\
+                     angular(aexps[ia],ashell,A,
+                     bexps[ib],bshell,B,C,direction)
     return l
 
 @cython.cdivision(True)
@@ -47,12 +64,17 @@ def RxDel(a, b, C, direction):
 @cython.wraparound(False)
 cpdef double T(object a, object b):
     """ Kinetic energy integrals """
-    cdef double t = 0.0
-    for ia, ca in enumerate(a.coefs):
-        for ib, cb in enumerate(b.coefs):
-            t += a.norm[ia]*b.norm[ib]*ca*cb*\
-                     kinetic(a.exps[ia],a.shell,a.origin,\
-                     b.exps[ib],b.shell,b.origin)
+    cdef:
+        double t = 0.0
+        long ia, ib
+        double [:] anorm = a.norm, acoefs = a.coefs, aexps = a.exps, A = a.origin
+        double [:] bnorm = b.norm, bcoefs = b.coefs, bexps = b.exps, B = b.origin
+        long [:] ashell = a.shell, bshell = b.shell
+    for ia in range(acoefs.shape[0]):
+        for ib in range(bcoefs.shape[0]):
+            t += anorm[ia]*bnorm[ib]*acoefs[ia]*bcoefs[ib]*\
+                     kinetic(aexps[ia],ashell,A,\
+                     bexps[ib],bshell,B)
     return t
 
 @cython.cdivision(True)
@@ -60,60 +82,133 @@ cpdef double T(object a, object b):
 @cython.wraparound(False)
 cpdef double V(object a, object b, double [:] C): 
     """ Nuclear attraction integrals """
-    cdef double v = 0.0
-    for ia, ca in enumerate(a.coefs):
-        for ib, cb in enumerate(b.coefs):
-            v += a.norm[ia]*b.norm[ib]*ca*cb*\
-                     nuclear_attraction(a.exps[ia],a.shell,a.origin,
-                     b.exps[ib],b.shell,b.origin,C)
+    cdef:
+        double v = 0.0
+        long ia, ib
+        double [:] anorm = a.norm, acoefs = a.coefs, aexps = a.exps, A = a.origin
+        double [:] bnorm = b.norm, bcoefs = b.coefs, bexps = b.exps, B = b.origin
+        long [:] ashell = a.shell, bshell = b.shell
+    for ia in range(acoefs.shape[0]):
+        for ib in range(bcoefs.shape[0]):
+            v += anorm[ia]*bnorm[ib]*acoefs[ia]*bcoefs[ib]*\
+                     nuclear_attraction(aexps[ia],ashell,A,
+                     bexps[ib],bshell,B,C)
     return v
 
-def overlap(a,lmn1,A,b,lmn2,B):
+# Batched versions of the above over basis function pairs (ii[n],jj[n]),
+# so that whole matrices are filled without a Python call per pair.
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def S_batch(list bfs, Py_ssize_t [:] ii, Py_ssize_t [:] jj):
+    cdef Py_ssize_t n
+    cdef double [:] vals = np.zeros(ii.shape[0])
+    for n in range(ii.shape[0]):
+        vals[n] = S(bfs[ii[n]],bfs[jj[n]])
+    return np.asarray(vals)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def T_batch(list bfs, Py_ssize_t [:] ii, Py_ssize_t [:] jj):
+    cdef Py_ssize_t n
+    cdef double [:] vals = np.zeros(ii.shape[0])
+    for n in range(ii.shape[0]):
+        vals[n] = T(bfs[ii[n]],bfs[jj[n]])
+    return np.asarray(vals)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def V_batch(list bfs, Py_ssize_t [:] ii, Py_ssize_t [:] jj, double [:] C):
+    cdef Py_ssize_t n
+    cdef double [:] vals = np.zeros(ii.shape[0])
+    for n in range(ii.shape[0]):
+        vals[n] = V(bfs[ii[n]],bfs[jj[n]],C)
+    return np.asarray(vals)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def Mu_batch(list bfs, Py_ssize_t [:] ii, Py_ssize_t [:] jj, double [:] C, str direction):
+    cdef Py_ssize_t n
+    cdef double [:] vals = np.zeros(ii.shape[0])
+    for n in range(ii.shape[0]):
+        vals[n] = Mu(bfs[ii[n]],bfs[jj[n]],C,direction)
+    return np.asarray(vals)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def RxDel_batch(list bfs, Py_ssize_t [:] ii, Py_ssize_t [:] jj, double [:] C, str direction):
+    cdef Py_ssize_t n
+    cdef double [:] vals = np.zeros(ii.shape[0])
+    for n in range(ii.shape[0]):
+        vals[n] = RxDel(bfs[ii[n]],bfs[jj[n]],C,direction)
+    return np.asarray(vals)
+
+@cython.cdivision(True)
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double overlap(double a, long [:] lmn1, double [:] A, double b, long [:] lmn2, double [:] B):
     """ Returns overlap between two primitive Gaussian basis functions """
-    l1,m1,n1 = lmn1
-    l2,m2,n2 = lmn2
-    S1 = E(l1,l2,0,A[0]-B[0],a,b)
-    S2 = E(m1,m2,0,A[1]-B[1],a,b)
-    S3 = E(n1,n2,0,A[2]-B[2],a,b)
-    return S1*S2*S3*np.power(pi/(a+b),1.5)
-
-
-def dipole(a,lmn1,A,b,lmn2,B,C,direction):
-    l1,m1,n1 = lmn1
-    l2,m2,n2 = lmn2
-    P = gaussian_product_center(a,A,b,B)
-    if direction.lower() == 'x':
-        XPC = P[0] - C[0]
+    cdef:
+        long l1 = lmn1[0], m1 = lmn1[1], n1 = lmn1[2]
+        long l2 = lmn2[0], m2 = lmn2[1], n2 = lmn2[2]
+        double S1 = E(l1,l2,0,A[0]-B[0],a,b)
+        double S2 = E(m1,m2,0,A[1]-B[1],a,b)
+        double S3 = E(n1,n2,0,A[2]-B[2],a,b)
+    return S1*S2*S3*pow(pi/(a+b),1.5)
+
+
+@cython.cdivision(True)
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double dipole(double a, long [:] lmn1, double [:] A, double b, long [:] lmn2, double [:] B, double [:] C, str direction):
+    cdef:
+        long l1 = lmn1[0], m1 = lmn1[1], n1 = lmn1[2]
+        long l2 = lmn2[0], m2 = lmn2[1], n2 = lmn2[2]
+        double p = a + b
+        double XPC, YPC, ZPC, D, S1, S2, S3
+    direction = direction.lower()
+    if direction == 'x':
+        XPC = (a*A[0] + b*B[0])/p - C[0]
         # Top call for 'D; works for sure, bottom works in terms of properties,
         # but the gauge-origin is different so the AO ints differ.
         D  = E(l1,l2,1,A[0]-B[0],a,b) + XPC*E(l1,l2,0,A[0]-B[0],a,b)
         #D  = E(l1,l2,0,A[0]-B[0],a,b,1)
         S2 = E(m1,m2,0,A[1]-B[1],a,b)
         S3 = E(n1,n2,0,A[2]-B[2],a,b)
-        return D*S2*S3*np.power(pi/(a+b),1.5)
-    elif direction.lower() == 'y':
-        YPC = P[1] - C[1]
+        return D*S2*S3*pow(pi/p,1.5)
+    elif direction == 'y':
+        YPC = (a*A[1] + b*B[1])/p - C[1]
         S1 = E(l1,l2,0,A[0]-B[0],a,b)
         D  = E(m1,m2,1,A[1]-B[1],a,b) + YPC*E(m1,m2,0,A[1]-B[1],a,b)
         #D  = E(m1,m2,0,A[1]-B[1],a,b,1)
         S3 = E(n1,n2,0,A[2]-B[2],a,b)
-        return S1*D*S3*np.power(pi/(a+b),1.5)
-    elif direction.lower() == 'z':
-        ZPC = P[2] - C[2]
+        return S1*D*S3*pow(pi/p,1.5)
+    elif direction == 'z':
+        ZPC = (a*A[2] + b*B[2])/p - C[2]
         S1 = E(l1,l2,0,A[0]-B[0],a,b)
         S2 = E(m1,m2,0,A[1]-B[1],a,b)
         D  = E(n1,n2,1,A[2]-B[2],a,b) + ZPC*E(n1,n2,0,A[2]-B[2],a,b)
         #D  = E(n1,n2,0,A[2]-B[2],a,b,1)
-        return S1*S2*D*np.power(pi/(a+b),1.5)
+        return S1*S2*D*pow(pi/p,1.5)
 
-def kinetic(a,lmn1,A,b,lmn2,B):
+@cython.cdivision(True)
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double kinetic(double a, long [:] lmn1, double [:] A, double b, long [:] lmn2, double [:] B):
     # explicit kinetic in terms of "E" operator
     # generalized to include GIAO derivatives
-    l1,m1,n1 = lmn1
-    l2,m2,n2 = lmn2
-    Ax,Ay,Az = (2*np.asarray(lmn2) + 1)*b
-    Bx = By = Bz = -2*np.power(b,2) # redundant, I know
-    Cx,Cy,Cz = -0.5*np.asarray(lmn2)*(np.asarray(lmn2)-1) 
+    cdef:
+        long l1 = lmn1[0], m1 = lmn1[1], n1 = lmn1[2]
+        long l2 = lmn2[0], m2 = lmn2[1], n2 = lmn2[2]
+        double Ax = (2*l2 + 1)*b
+        double Ay = (2*m2 + 1)*b
+        double Az = (2*n2 + 1)*b
+        double Bx = -2*b*b # redundant, I know
+        double By = Bx
+        double Bz = Bx
+        double Cx = -0.5*l2*(l2-1)
+        double Cy = -0.5*m2*(m2-1)
+        double Cz = -0.5*n2*(n2-1)
+        double Tx, Ty, Tz
 
     Tx = Ax*E(l1,l2  ,0,A[0]-B[0],a,b) + \
          Bx*E(l1,l2+2,0,A[0]-B[0],a,b) + \
@@ -133,18 +228,18 @@ def kinetic(a,lmn1,A,b,lmn2,B):
     Tz *= E(l1,l2,0,A[0]-B[0],a,b)
     Tz *= E(m1,m2,0,A[1]-B[1],a,b)
 
-    return (Tx + Ty + Tz)*np.power(pi/(a+b),1.5)
+    return (Tx + Ty + Tz)*pow(pi/(a+b),1.5)
           
 
-def angular(a, lmn1, A, b, lmn2, B, C, direction):
+@cython.cdivision(True)
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double angular(double a, long [:] lmn1, double [:] A, double b, long [:] lmn2, double [:] B, double [:] C, str direction):
     # a little extra work at the moment, but not all that more expensive
-    l1,m1,n1 = lmn1
-    l2,m2,n2 = lmn2
-    P = gaussian_product_center(a,A,b,B)
-
-    XPC = P[0] - C[0]
-    YPC = P[1] - C[1]
-    ZPC = P[2] - C[2]
+    cdef:
+        long l1 = lmn1[0], m1 = lmn1[1], n1 = lmn1[2]
+        long l2 = lmn2[0], m2 = lmn2[1], n2 = lmn2[2]
+        double S0x, S0y, S0z, S1x, S1y, S1z, D1x, D1y, D1z
 
     S0x =    E(l1,l2,0,A[0]-B[0],a,b) 
     S0y =    E(m1,m2,0,A[1]-B[1],a,b) 
@@ -163,31 +258,41 @@ def angular(a, lmn1, A, b, lmn2, B, C, direction):
     D1y = m2*E(m1,m2-1,0,A[1]-B[1],a,b) - 2*b*E(m1,m2+1,0,A[1]-B[1],a,b)
     D1z = n2*E(n1,n2-1,0,A[2]-B[2],a,b) - 2*b*E(n1,n2+1,0,A[2]-B[2],a,b)
 
-    if direction.lower() == 'x':
-        return -S0x*(S1y*D1z - S1z*D1y)*np.power(pi/(a+b),1.5) 
+    direction = direction.lower()
+    if direction == 'x':
+        return -S0x*(S1y*D1z - S1z*D1y)*pow(pi/(a+b),1.5) 
 
-    elif direction.lower() == 'y':
-        return -S0y*(S1z*D1x - S1x*D1z)*np.power(pi/(a+b),1.5) 
+    elif direction == 'y':
+        return -S0y*(S1z*D1x - S1x*D1z)*pow(pi/(a+b),1.5) 
 
-    elif direction.lower() == 'z':
-        return -S0z*(S1x*D1y - S1y*D1x)*np.power(pi/(a+b),1.5) 
+    elif direction == 'z':
+        return -S0z*(S1x*D1y - S1y*D1x)*pow(pi/(a+b),1.5) 
 
-def nuclear_attraction(a,lmn1,A,b,lmn2,B,C):
+@cython.cdivision(True)
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double nuclear_attraction(double a, long [:] lmn1, double [:] A, double b, long [:] lmn2, double [:] B, double [:] C):
     """ Returns nuclear attraction integral between two primitive Gaussians"""
-    l1,m1,n1 = lmn1
-    l2,m2,n2 = lmn2
-    p = a + b
-    P = np.asarray(gaussian_product_center(a,A,b,B))
-    RPC = np.linalg.norm(P-C)
-
-    val = 0.0
-    for t in xrange(l1+l2+1):
-        for u in xrange(m1+m2+1):
-            for v in xrange(n1+n2+1):
+    cdef:
+        long l1 = lmn1[0], m1 = lmn1[1], n1 = lmn1[2]
+        long l2 = lmn2[0], m2 = lmn2[1], n2 = lmn2[2]
+        long t, u, v
+        double p = a + b
+        double Px = (a*A[0] + b*B[0])/p
+        double Py = (a*A[1] + b*B[1])/p
+        double Pz = (a*A[2] + b*B[2])/p
+        double RPC = sqrt(pow(Px-C[0],2) + \
+                          pow(Py-C[1],2) + \
+                          pow(Pz-C[2],2))
+        double val = 0.0
+
+    for t in range(l1+l2+1):
+        for u in range(m1+m2+1):
+            for v in range(n1+n2+1):
                 val += E(l1,l2,t,A[0]-B[0],a,b) * \
                        E(m1,m2,u,A[1]-B[1],a,b) * \
                        E(n1,n2,v,A[2]-B[2],a,b) * \
-                       R(t,u,v,0,p,P[0]-C[0],P[1]-C[1],P[2]-C[2],RPC) 
+                       R(t,u,v,0,p,Px-C[0],Py-C[1],Pz-C[2],RPC) 
     val *= 2*pi/p # Pink book, Eq(9.9.40) 
     return val 
 
@@ -1,5 +1,6 @@
 from __future__ import division
 import cython
+from cython.parallel import prange
 import numpy as np
 cimport numpy as np
 from libc.math cimport exp, pow, tgamma, sqrt, abs
@@ -11,25 +12,64 @@ include "basis.pxi"
 @cython.wraparound(False)
 cpdef double [:,:,:,:] doERIs(long N,double [:,:,:,:] TwoE, list bfs):
     cdef:
-        long i,j,k,l,ij,kl
-    for i in (range(N)):
-        for j in range(i+1):
-            ij = (i*(i+1)//2 + j)
-            for k in range(N):
-                for l in range(k+1):
-                    kl = (k*(k+1)//2 + l)
-                    if ij >= kl:
-                       val = ERI(bfs[i],bfs[j],bfs[k],bfs[l])
-                       TwoE[i,j,k,l] = val
-                       TwoE[k,l,i,j] = val
-                       TwoE[j,i,l,k] = val
-                       TwoE[l,k,j,i] = val
-                       TwoE[j,i,k,l] = val
-                       TwoE[l,k,i,j] = val
-                       TwoE[i,j,l,k] = val
-                       TwoE[k,l,j,i] = val
+        long i,j,k,l,ij,kl,npair
+        double val
+        Py_ssize_t [:] ii, jj # np.intp from np.tril_indices
+        long [:] nprim
+        long [:,::1] shell
+        double [:,::1] origin, exps, coefs, norm
+    # copy the basis into flat arrays (primitives zero padded) so the quartet
+    # loop can run without the GIL
+    pad = max([bf.num_exps for bf in bfs])
+    nprim = np.array([bf.num_exps for bf in bfs],dtype=np.int_)
+    exps  = np.array([np.pad(bf.exps,(0,pad-bf.num_exps),'constant') for bf in bfs])
+    coefs = np.array([np.pad(bf.coefs,(0,pad-bf.num_exps),'constant') for bf in bfs])
+    norm  = np.array([np.pad(bf.norm,(0,pad-bf.num_exps),'constant') for bf in bfs])
+    shell = np.array([bf.shell for bf in bfs],dtype=np.int_)
+    origin = np.array([bf.origin for bf in bfs],dtype=np.double)
+
+    # only visit canonical quartets i >= j, k >= l, ij >= kl; pairs are
+    # handed out to threads dynamically, largest ij (most kl <= ij) first.
+    # Each canonical quartet owns its 8 symmetric elements, so no races
+    npair = N*(N+1)//2
+    ii, jj = np.tril_indices(N)
+    for ij in prange(npair-1,-1,-1,nogil=True,schedule='dynamic'):
+        i = ii[ij]
+        j = jj[ij]
+        for kl in range(ij+1):
+            k = ii[kl]
+            l = jj[kl]
+            val = contracted_eri(i,j,k,l,nprim,shell,origin,exps,coefs,norm)
+            TwoE[i,j,k,l] = val
+            TwoE[k,l,i,j] = val
+            TwoE[j,i,l,k] = val
+            TwoE[l,k,j,i] = val
+            TwoE[j,i,k,l] = val
+            TwoE[l,k,i,j] = val
+            TwoE[i,j,l,k] = val
+            TwoE[k,l,j,i] = val
     return TwoE
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double contracted_eri(long i, long j, long k, long l, long [:] nprim,
+                           long [:,::1] shell, double [:,::1] origin,
+                           double [:,::1] exps, double [:,::1] coefs,
+                           double [:,::1] norm) nogil:
+    """ ERI over basis functions i,j,k,l given as rows of doERIs arrays """
+    cdef double eri = 0.0
+    cdef long ja, jb, jc, jd
+    for ja in range(nprim[i]):
+        for jb in range(nprim[j]):
+            for jc in range(nprim[k]):
+                for jd in range(nprim[l]):
+                    eri += norm[i,ja]*norm[j,jb]*norm[k,jc]*norm[l,jd]*\
+                             coefs[i,ja]*coefs[j,jb]*coefs[k,jc]*coefs[l,jd]*\
+                             electron_repulsion(exps[i,ja],&shell[i,0],&origin[i,0],\
+                                                exps[j,jb],&shell[j,0],&origin[j,0],\
+                                                exps[k,jc],&shell[k,0],&origin[k,0],\
+                                                exps[l,jd],&shell[l,0],&origin[l,0])
+    return eri
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
@@ -53,7 +93,7 @@ cpdef double ERI(Basis a, Basis b, Basis c, Basis d):
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.nonecheck(False)
-cdef double electron_repulsion(double a, long *lmn1, double *A, double b, long *lmn2, double *B,double c, long *lmn3, double *C,double d, long *lmn4, double *D):
+cdef double electron_repulsion(double a, long *lmn1, double *A, double b, long *lmn2, double *B,double c, long *lmn3, double *C,double d, long *lmn4, double *D) nogil:
     cdef:
         long l1 = lmn1[0], m1 = lmn1[1], n1 = lmn1[2]
         long l2 = lmn2[0], m2 = lmn2[1], n2 = lmn2[2]
@@ -2,9 +2,8 @@ from __future__ import division
 import sys
 import os
 import numpy as np
-from mmd.integrals.onee import S,T,Mu,V,RxDel
+from mmd.integrals.onee import S_batch,T_batch,Mu_batch,V_batch,RxDel_batch
 from mmd.integrals.twoe import doERIs, ERI
-from scipy.linalg import fractional_matrix_power as mat_pow
 from mmd.scf import SCF
 from mmd.forces import Forces
 from mmd.integrals.twoe import Basis
@@ -250,30 +249,22 @@ class Molecule(SCF,Forces):
         # Get one electron integrals
         #print "One-electron integrals"
 
-        for i in (range(N)):
-            for j in range(i+1):
-                self.S[i,j] = self.S[j,i] \
-                    = S(self.bfs[i],self.bfs[j])
-                self.T[i,j] = self.T[j,i] \
-                    = T(self.bfs[i],self.bfs[j])
-                self.M[0,i,j] = self.M[0,j,i] \
-                    = Mu(self.bfs[i],self.bfs[j],self.center_of_charge,'x')
-                self.M[1,i,j] = self.M[1,j,i] \
-                    = Mu(self.bfs[i],self.bfs[j],self.center_of_charge,'y')
-                self.M[2,i,j] = self.M[2,j,i] \
-                    = Mu(self.bfs[i],self.bfs[j],self.center_of_charge,'z')
-                for atom in self.atoms:
-                    self.V[i,j] += -atom.charge*V(self.bfs[i],self.bfs[j],atom.origin)
-                self.V[j,i] = self.V[i,j]
+        # canonical (i >= j) pairs, computed in one sweep per operator
+        ii, jj = np.tril_indices(N)
+        self.S[ii,jj] = self.S[jj,ii] = S_batch(self.bfs,ii,jj)
+        self.T[ii,jj] = self.T[jj,ii] = T_batch(self.bfs,ii,jj)
+        for x,direction in enumerate(['x','y','z']):
+            self.M[x,ii,jj] = self.M[x,jj,ii] \
+                = Mu_batch(self.bfs,ii,jj,self.center_of_charge,direction)
+            # RxDel is antisymmetric
+            self.L[x,ii,jj] \
+                = RxDel_batch(self.bfs,ii,jj,self.center_of_charge,direction)
+            self.L[x,jj,ii] = -1*self.L[x,ii,jj]
 
-                # RxDel is antisymmetric
-                self.L[0,i,j] \
-                    = RxDel(self.bfs[i],self.bfs[j],self.center_of_charge,'x')
-                self.L[1,i,j] \
-                    = RxDel(self.bfs[i],self.bfs[j],self.center_of_charge,'y')
-                self.L[2,i,j] \
-                    = RxDel(self.bfs[i],self.bfs[j],self.center_of_charge,'z')
-                self.L[:,j,i] = -1*self.L[:,i,j] 
+        # nuclear attraction, (natoms,npairs) contracted with nuclear charges
+        charges = np.asarray([atom.charge for atom in self.atoms])
+        Vn = np.asarray([V_batch(self.bfs,ii,jj,atom.origin) for atom in self.atoms])
+        self.V[ii,jj] = self.V[jj,ii] = -np.dot(charges,Vn)
 
         # Compute nuclear repulsion energy 
         for pair in itertools.combinations(self.atoms,2):
@@ -282,8 +273,11 @@ class Molecule(SCF,Forces):
            
         # Preparing for SCF
         self.Core       = self.T + self.V
-        self.X          = mat_pow(self.S,-0.5)
-        self.U          = mat_pow(self.S,0.5)
+        # S is symmetric positive definite, so one eigendecomposition
+        # gives both S^-1/2 and S^1/2
+        w, V            = np.linalg.eigh(self.S)
+        self.X          = np.dot(V*np.power(w,-0.5),V.T)
+        self.U          = np.dot(V*np.power(w,0.5),V.T)
 
     def two_electron_integrals(self):
         """Routine to setup and compute two-electron integrals"""
@@ -3,12 +3,36 @@ from __future__ import print_function
 import numpy as np
 import scipy
 import sys
-from itertools import product, combinations
+from itertools import combinations
 from bitstring import BitArray
-from mmd.slater import common_index, get_excitation
+from mmd.slater import common_index, get_excitation, popcount, trailz_array, n_between
 from mmd.utils.davidson import davidson
 from scipy.special import comb
-from scipy.linalg import sqrtm, lu
+from scipy.linalg import sqrtm, lu, lu_factor, lu_solve
+from scipy.sparse.linalg import LinearOperator, eigs
+
+def pair_index(p,q):
+    """ Returns compound index of the orbital pair p,q (order ignored) and
+        the sign of the ordering; both are zero if p == q
+    """
+    sign = np.sign(q - p)
+    high, low = np.maximum(p,q), np.minimum(p,q)
+    return np.where(sign == 0, 0, high*(high - 1)//2 + low), sign
+
+def canonical_index(p,q,r,s):
+    """ Returns offset into packed <pq||rs> storage (canonical p < q, r < s,
+        pq >= rs) and the signs from antisymmetry in p,q and in r,s; a sign
+        is zero if p == q or r == s, where <pq||rs> vanishes. Pair indices
+        and signs keep the (smaller) broadcast shapes of p,q and r,s, only
+        the offset takes the full shape
+    """
+    pq, sign_pq = pair_index(p,q)
+    rs, sign_rs = pair_index(r,s)
+    idx = np.maximum(pq,rs)
+    idx *= idx + 1
+    idx //= 2
+    idx += np.minimum(pq,rs)
+    return idx, sign_pq, sign_rs
 
 class PostSCF(object):
     """Class for post-scf routines"""
@@ -18,70 +42,112 @@ class PostSCF(object):
             sys.exit("SCF not converged, skipping Post-SCF")
         self.ao2mo()
 
-    def ao2mo(self):
-        """Routine to convert AO integrals to MO integrals"""
-        self.mol.single_bar = np.einsum('mp,mnlz->pnlz',
-                                        self.mol.C,self.mol.TwoE)
-        temp = np.einsum('nq,pnlz->pqlz',
-                         self.mol.C,self.mol.single_bar)
-        self.mol.single_bar = np.einsum('lr,pqlz->pqrz',
-                                        self.mol.C,temp)
-        temp = np.einsum('zs,pqrz->pqrs',
-                         self.mol.C,self.mol.single_bar)
+    def ao2mo(self,force=False):
+        """Routine to convert AO integrals to MO integrals
+
+           The transformed integrals are stored on mol along with the MO
+           coefficients used, so later PostSCF(mol) instances skip the
+           transform unless the SCF has changed C, or force is True.
+        """
+        if not force and getattr(self.mol,'_ao2mo_C',None) is not None \
+                and np.array_equal(self.mol._ao2mo_C,self.mol.C):
+            return
+
+        # four quarter transforms as matrix products; each contracts the
+        # leading AO index and appends the MO index, (mnlz) -> (nlzp)
+        N = self.mol.nbasis
+        temp = self.mol.TwoE
+        for _ in range(4):
+            temp = np.dot(temp.reshape(N,-1).T,self.mol.C).reshape(N,N,N,N)
         self.mol.single_bar = temp
 
-        # TODO: Make this tx more elegant?
         # tile spin to make spin orbitals from spatial (twice dimension)
 
         self.mol.norb = self.mol.nbasis * 2 # spin orbital
 
-        self.mol.double_bar = np.zeros([2*idx for idx in self.mol.single_bar.shape])
-        for p in range(self.mol.double_bar.shape[0]):
-            for q in range(self.mol.double_bar.shape[1]):
-                for r in range(self.mol.double_bar.shape[2]):
-                    for s in range(self.mol.double_bar.shape[3]):
-                        value1 = self.mol.single_bar[p//2,r//2,q//2,s//2].real * (p%2==r%2) * (q%2==s%2)
-                        value2 = self.mol.single_bar[p//2,s//2,q//2,r//2].real * (p%2==s%2) * (q%2==r%2)
-                        self.mol.double_bar[p,q,r,s] = value1 - value2
+        # <pq||rs> is antisymmetric in p,q and r,s and symmetric in pq,rs,
+        # so only canonical p < q, r < s, pq >= rs elements are stored in a
+        # flat array mol.double_bar_packed (~norb^4/8); use
+        # PostSCF.double_bar(p,q,r,s) to access
+        q_, p_ = np.tril_indices(self.mol.norb,k=-1) # pair index pq, p < q
+        npair = len(p_)
+        row = np.arange(npair + 1)*np.arange(1,npair + 2)//2 # row pq offsets
+        self.mol.double_bar_packed = np.empty(row[-1])
+
+        # fill rows pq in blocks of ~1/32 of the packed array, so the index
+        # temporaries stay small next to the result
+        g = self.mol.single_bar.real
+        chunk = max(row[-1]//32,npair)
+        bounds = np.unique(np.append(np.searchsorted(row,np.arange(0,row[-1],chunk)),npair))
+        for start, stop in zip(bounds[:-1],bounds[1:]):
+            pq = np.repeat(np.arange(start,stop),np.arange(start,stop) + 1)
+            rs = np.arange(row[start],row[stop]) - row[pq]
+            p, q, r, s = p_[pq], q_[pq], p_[rs], q_[rs]
+            # spin orbitals alternate alpha/beta, spatial orbital is index//2
+            # <pq||rs> = (pr|qs) d(sp,sr) d(sq,ss) - (ps|qr) d(sp,ss) d(sq,sr)
+            block = g[p//2,r//2,q//2,s//2] * ((p%2 == r%2) & (q%2 == s%2))
+            block -= g[p//2,s//2,q//2,r//2] * ((p%2 == s%2) & (q%2 == r%2))
+            self.mol.double_bar_packed[row[start]:row[stop]] = block
 
         # create Hp, the spin basis one electron operator 
-        spin = np.eye(2)
-        self.mol.Hp = np.kron(np.einsum('uj,vi,uv', self.mol.C, self.mol.C, self.mol.Core).real,spin)
+        self.mol.Hp = PostSCF.spin_block(np.einsum('uj,vi,uv', self.mol.C, self.mol.C, self.mol.Core, optimize=True).real)
 
         # create fs, the spin basis fock matrix eigenvalues 
-        self.mol.fs = np.kron(np.diag(self.mol.MO),spin)
+        self.mol.fs = PostSCF.spin_block(np.diag(self.mol.MO))
+        # and its diagonal, the spin orbital energies, kept 1-D for broadcasts
+        self.mol.eps = np.repeat(self.mol.MO,2)
 
+        self.mol._ao2mo_C = self.mol.C.copy()
+
+    def double_bar(self,p,q,r,s):
+        """ Returns <pq||rs> from packed storage; p,q,r,s may be integers or
+            index arrays, which broadcast against each other like NumPy
+            fancy indexing
+        """
+        idx, sign_pq, sign_rs = canonical_index(p,q,r,s)
+        value = self.mol.double_bar_packed[idx]
+        value *= sign_pq
+        value *= sign_rs
+        return value
     
     def MP2(self,spin_orbital=False):
         """Routine to compute MP2 energy from RHF reference"""
         if spin_orbital:
             # Use spin orbitals from RHF reference
-            EMP2 = 0.0
-            occupied = range(self.mol.nelec)
-            virtual  = range(self.mol.nelec,self.mol.norb)
-            for i,j,a,b in product(occupied,occupied,virtual,virtual):
-                denom = self.mol.fs[i,i] + self.mol.fs[j,j] \
-                      - self.mol.fs[a,a] - self.mol.fs[b,b]
-                numer = self.mol.double_bar[i,j,a,b]**2 
-                EMP2 += numer/denom
+            eps = self.mol.eps
+            occupied = np.arange(self.mol.nelec)
+            virtual  = np.arange(self.mol.nelec,self.mol.norb)
+            eo, ev = eps[occupied], eps[virtual]
+            denom = eo[:,None,None,None] + eo[None,:,None,None] \
+                  - ev[None,None,:,None] - ev[None,None,None,:]
+            ijab = self.double_bar(*np.ix_(occupied,occupied,virtual,virtual))
+            EMP2 = np.sum(ijab**2/denom)
 
             self.mol.emp2 = 0.25*EMP2 + self.mol.energy   
         else:
             # Use spatial orbitals from RHF reference
-            EMP2 = 0.0
-            occupied = range(self.mol.nocc)
-            virtual  = range(self.mol.nocc,self.mol.nbasis)
-            for i,j,a,b in product(occupied,occupied,virtual,virtual):
-                denom = self.mol.MO[i] + self.mol.MO[j] \
-                      - self.mol.MO[a] - self.mol.MO[b]
-                numer = self.mol.single_bar[i,a,j,b] \
-                      * (2.0*self.mol.single_bar[i,a,j,b] 
-                        - self.mol.single_bar[i,b,j,a])
-                EMP2 += numer/denom
+            nocc = self.mol.nocc
+            eo, ev = self.mol.MO[:nocc], self.mol.MO[nocc:]
+            denom = eo[:,None,None,None] - ev[None,:,None,None] \
+                  + eo[None,None,:,None] - ev[None,None,None,:]
+            iajb = self.mol.single_bar[:nocc,nocc:,:nocc,nocc:]
+            EMP2 = np.sum(iajb*(2.0*iajb - iajb.transpose(0,3,2,1))/denom)
             self.mol.emp2 = EMP2 + self.mol.energy   
 
         print('E(MP2) = ', self.mol.emp2.real) 
 
+    @staticmethod
+    def spin_block(M):
+        ''' From spatial orbital matrix (or stack of matrices) M, return the
+            spin orbital form with alternating alpha and beta blocks, i.e.
+            np.kron(M,np.eye(2)) without forming the outer product
+        '''
+        N = M.shape[-1]
+        spin_M = np.zeros(M.shape[:-2] + (2*N,2*N),dtype=M.dtype)
+        spin_M[...,0::2,0::2] = M
+        spin_M[...,1::2,1::2] = M
+        return spin_M
+
     @staticmethod
     def tuple2bitstring(bit_tuple):
         ''' From tuple of occupied orbitals, return bitstring representation '''
@@ -95,6 +161,11 @@ class PostSCF(object):
     def hamiltonian_matrix_element(self,det1,det2,Nint):
         """ return general Hamiltonian matrix element <det1|H|det2> """
 
+        # slater.py does its bit operations on Python ints, so convert the
+        # uint64 words used by build_full_hamiltonian and add_particles
+        det1 = [int(d) for d in det1]
+        det2 = [int(d) for d in det2]
+
         exc, degree, phase = get_excitation(det1,det2,Nint)
 
         if degree > 2:
@@ -102,39 +173,95 @@ class PostSCF(object):
 
         elif degree == 2:
             # sign * <hole1,hole2||particle1,particle2>
-            return phase * self.mol.double_bar[exc[1,0], exc[2,0], exc[1,1], exc[2,1]]
+            return phase * self.double_bar(exc[1,0], exc[2,0], exc[1,1], exc[2,1])
 
         elif degree == 1:
             m = exc[1,0]
             p = exc[1,1]
             common = common_index(det1,det2,Nint)
-            tmp = self.mol.Hp[m,p]
-            for n in common:
-                tmp += self.mol.double_bar[m, n, p, n]
+            tmp = self.mol.Hp[m,p] + np.sum(self.double_bar(m,common,p,common))
             return phase * tmp
 
         elif degree == 0:
             # kind of lazy to use common_index...
-            common = common_index(det1,det2,Nint)
-            tmp = 0.0
-            for m in common:
-                tmp += self.mol.Hp[m, m]
-                for n in common:
-                    tmp += 0.5*self.mol.double_bar[m,n,m,n]
+            common = np.asarray(common_index(det1,det2,Nint))
+            m, n = common[:,None], common[None,:]
+            tmp = np.sum(self.mol.Hp[common,common]) \
+                + 0.5*np.sum(self.double_bar(m,n,m,n))
             return phase * tmp
 
     def build_full_hamiltonian(self,det_list):
-        ''' Given a list of determinants, construct the full Hamiltonian matrix '''
+        ''' Given a list of determinants, construct the full Hamiltonian matrix
+
+            Lower triangle pairs connected by at most a double excitation are
+            flattened into 1-D index arrays and grouped by excitation degree,
+            so each class of Slater-Condon rule is evaluated in one sweep.
+            Determinants are assumed to fit a single 64-bit word.
+        '''
+
+        # FIXME: limited to 64 orbitals at the moment
+        if self.mol.norb > 64:
+            print("Number spin orbitals: ",self.mol.norb)
+            sys.exit("Determinants must fit in 64 bits. Quitting.")
 
-        Nint = int(np.floor(self.mol.norb/64) + 1)
         H = np.zeros((len(det_list),len(det_list)))
 
+        # determinants as rows of uint64 words for vectorized bit operations
+        dets = np.asarray(det_list,dtype=np.uint64).reshape(len(det_list),-1)
+
         print("Building Hamiltonian...")
-        for idx,det1 in enumerate(det_list):
-            for jdx,det2 in enumerate(det_list[:(idx+1)]):
-               value = self.hamiltonian_matrix_element(det1,det2,Nint)
-               H[idx,jdx] = value
-               H[jdx,idx] = value
+        rows, cols, degrees = [], [], []
+        for idx in range(len(det_list)):
+            # Slater-Condon rules vanish beyond double excitations
+            degree = popcount(dets[:(idx+1)] ^ dets[idx]).sum(axis=1) >> 1
+            jdx = np.flatnonzero(degree <= 2)
+            rows.append(np.full(len(jdx),idx))
+            cols.append(jdx)
+            degrees.append(degree[jdx])
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+        degrees = np.concatenate(degrees)
+
+        orbitals = np.arange(self.mol.norb)
+        values = np.zeros(len(rows))
+
+        # degree 0: sum_m h_mm + 1/2 sum_mn <mn||mn> over occupied m,n
+        diag = degrees == 0
+        occ = (dets[rows[diag],0][:,None] >> orbitals.astype(np.uint64)) & np.uint64(1)
+        occ = occ.astype(np.float64)
+        J = self.double_bar(orbitals[:,None],orbitals[None,:],
+                            orbitals[:,None],orbitals[None,:])
+        values[diag] = np.dot(occ,np.diag(self.mol.Hp)) \
+                     + 0.5*np.einsum('km,mn,kn->k',occ,J,occ,optimize=True)
+
+        # degree 1: h_mp + sum_n <mn||pn> over common occupied n
+        single = degrees == 1
+        det1, det2 = dets[rows[single],0], dets[cols[single],0]
+        m = trailz_array(det1 & ~det2) # hole
+        p = trailz_array(det2 & ~det1) # particle
+        nperm = n_between(det1,np.minimum(m,p),np.maximum(m,p))
+        common = (det1 & det2)[:,None] >> orbitals.astype(np.uint64) & np.uint64(1)
+        tmp = self.mol.Hp[m,p] \
+            + np.sum(common*self.double_bar(m[:,None],orbitals[None,:],
+                                            p[:,None],orbitals[None,:]),axis=1)
+        values[single] = (1 - 2*(nperm & 1)) * tmp
+
+        # degree 2: sign * <hole1,hole2||particle1,particle2>
+        double = degrees == 2
+        det1, det2 = dets[rows[double],0], dets[cols[double],0]
+        holes, particles = det1 & ~det2, det2 & ~det1
+        h1 = trailz_array(holes)
+        h2 = trailz_array(holes & (holes - np.uint64(1)))
+        p1 = trailz_array(particles)
+        p2 = trailz_array(particles & (particles - np.uint64(1)))
+        a, b = np.minimum(h1,p1), np.maximum(h1,p1)
+        c, d = np.minimum(h2,p2), np.maximum(h2,p2)
+        nperm = n_between(det1,a,b) + n_between(det1,c,d) \
+              + ((c > a) & (c < b) & (d > b))
+        values[double] = (1 - 2*(nperm & 1)) * self.double_bar(h1,h2,p1,p2)
+
+        H[rows,cols] = values
+        H[cols,rows] = values
 
         return H
 
@@ -144,35 +271,34 @@ class PostSCF(object):
         '''
         nOrb = self.mol.norb
         residue_list = []
-        nonzero = bin(determinant).count('1')
-        for i in range(nOrb):
-            mask1 = (1 << i) 
-            for j in range(i):
-                mask2 = (1 << j) 
-                mask = mask1 ^ mask2
-                if bin(determinant & ~mask).count('1') == (nonzero - 2):
-                    residue_list.append(determinant & ~mask)
+        # removing two electrons only makes sense from occupied orbitals, so
+        # test bits directly rather than counting them for every (i,j) pair
+        occupied = [i for i in range(nOrb) if (determinant >> i) & 1]
+        for j,i in combinations(occupied,2):
+            mask = (1 << i) | (1 << j)
+            residue_list.append(determinant & ~mask)
         return residue_list
     
     def add_particles(self,residue_list):
-        ''' Returns list of determinants, which is all possible ways to add two
-            electrons from a given residue_list with number of orbitals nOrb
+        ''' Returns sorted uint64 array of determinants, which is all possible
+            ways to add two electrons from a given residue_list with number of
+            orbitals nOrb
         '''
         nOrb = self.mol.norb
+        # FIXME: limited to 64 orbitals at the moment, as shifts past the
+        # last bit of a uint64 word would silently drop orbitals
+        if nOrb > 64:
+            print("Number spin orbitals: ",nOrb)
+            sys.exit("Determinants must fit in 64 bits. Quitting.")
+        orbitals = np.uint64(1) << np.arange(nOrb,dtype=np.uint64)
         determinants = []
         for residue in residue_list:
-            determinant = residue
-            for i in range(nOrb):
-                mask1 = (1 << i)
-                if not bool(determinant & mask1):
-                    one_particle = determinant | mask1
-                    for j in range(i):
-                        mask2 = (1 << j)
-                        if not bool(one_particle & mask2):
-                            two_particle = one_particle | mask2
-                            determinants.append(two_particle)
-        #return [format(det,'#0'+str(n_orbitals+2)+'b') for det in list(set(determinants))]
-        return list(set(determinants))
+            residue = np.uint64(residue)
+            # add particles to each pair of empty orbitals i < j
+            empty = orbitals[(residue & orbitals) == 0]
+            i, j = np.triu_indices(len(empty),k=1)
+            determinants.append(residue | empty[i] | empty[j])
+        return np.unique(np.concatenate(determinants))
     
     def single_and_double_determinants(self,determinant):
         return [np.array([i]) for i in self.add_particles(self.residues(determinant))]
@@ -245,16 +371,16 @@ class PostSCF(object):
         nOV = nOcc * nVir 
         occ = slice(nOcc)
         vir = slice(nOcc,self.mol.norb)
+        occupied = np.arange(nOcc)
+        virtual  = np.arange(nOcc,self.mol.norb)
  
         if nOV > 5000:
             print("Number determinants: ",nOV)
             sys.exit("CIS too expensive. Quitting.")
 
-        A  = np.einsum('ab,ij->iajb',np.diag(np.diag(self.mol.fs)[vir]),np.diag(np.ones(nOcc))) # + e_a
-        A -= np.einsum('ij,ab->iajb',np.diag(np.diag(self.mol.fs)[occ]),np.diag(np.ones(nVir))) # - e_i
-        A += np.einsum('ajib->iajb',self.mol.double_bar[vir,occ,occ,vir]) # + <aj||ib>
-
-        A = A.reshape(nOV,nOV)
+        eps = self.mol.eps
+        A = self.double_bar(*np.ix_(virtual,occupied,occupied,virtual)).transpose(2,0,1,3).reshape(nOV,nOV) # + <aj||ib>
+        A[np.diag_indices(nOV)] += (eps[vir][None,:] - eps[occ][:,None]).ravel() # + e_a - e_i
 
         #if construction == 'bitstring':
         #    det_list = []
@@ -275,14 +401,21 @@ class PostSCF(object):
         #    A += np.eye(len(A))*(- self.mol.energy.real + self.mol.nuc_energy) 
 
  
+        # only the lowest states are reported, so only solve for those
+        nstates = min(30,nOV)
         print("Diagonalizing Hamiltonian...")
-        transition_energies, transition_densities = scipy.linalg.eigh(A)
+        try:
+            transition_energies, transition_densities = \
+                scipy.linalg.eigh(A,subset_by_index=[0,nstates-1])
+        except TypeError:
+            # SciPy < 1.5 names the same LAPACK range option 'eigvals'
+            transition_energies, transition_densities = \
+                scipy.linalg.eigh(A,eigvals=(0,nstates-1))
 
         # MO tx dipole integrals
-        spin = np.eye(2)
-        mo_basis_dipoles = np.kron(np.einsum('uj,vi,...uv', \
+        mo_basis_dipoles = PostSCF.spin_block(np.einsum('uj,vi,...uv', \
                 self.mol.C, self.mol.C, \
-                self.mol.M).real,spin)
+                self.mol.M, optimize=True).real)
      
         oscillator_strengths = np.zeros_like(transition_energies) 
         for state in range(len(transition_energies)):
@@ -304,17 +437,24 @@ class PostSCF(object):
         print("------------------------------")
         print("# Determinants: ",len(A))
         print("nOcc * nVirt:   ",nOV)
-        for state in range(min(len(A),30)):
+        for state in range(nstates):
             print("CIS state %2s (eV): %12.4f (f=%6.4f)" % (state+1,self.mol.cis_omega[state],self.mol.cis_oscil[state]))
 
 
-    def TDHF(self,alg='hermitian'):
+    def TDHF(self,alg='hermitian',nroots=None):
         """  Routine to compute TDHF from RHF reference
     
              alg: 'hermitian' (does the Hermitian reduced variant, sqrt(A-B).(A+B).sqrt(A-B))
                   'reduced' (does the non-Hermitian reduced variant, (A-B).(A+B))
                   'full' (does the non-Hermitian [[A,B],[-B.T,-A.T]]')
 
+             nroots: for 'reduced' and 'full', solve only for the lowest
+                     nroots states with ARPACK in shift-invert mode about
+                     zero. This still LU factors A+B and A-B, O(nOV^3), but
+                     that is much cheaper than a dense nonsymmetric eig of
+                     the same or twice the dimension. Default (None) solves
+                     for all states; not supported for 'hermitian'.
+
         """
 
         nOcc = self.mol.nelec
@@ -322,16 +462,18 @@ class PostSCF(object):
         nOV = nOcc * nVir 
         occ = slice(nOcc)
         vir = slice(nOcc,self.mol.norb)
+        occupied = np.arange(nOcc)
+        virtual  = np.arange(nOcc,self.mol.norb)
 
         # form full A and B matrices
-        A  = np.einsum('ab,ij->iajb',np.diag(np.diag(self.mol.fs)[vir]),np.diag(np.ones(nOcc))) # + e_a 
-        A -= np.einsum('ij,ab->iajb',np.diag(np.diag(self.mol.fs)[occ]),np.diag(np.ones(nVir))) # - e_i
-        A += np.einsum('ajib->iajb',self.mol.double_bar[vir,occ,occ,vir]) # + <aj||ib>
+        eps = self.mol.eps
+        A = self.double_bar(*np.ix_(virtual,occupied,occupied,virtual)).transpose(2,0,1,3).reshape(nOV,nOV) # + <aj||ib>
+        A[np.diag_indices(nOV)] += (eps[vir][None,:] - eps[occ][:,None]).ravel() # + e_a - e_i
 
-        B  = np.einsum('abij->iajb',self.mol.double_bar[vir,vir,occ,occ]) # + <ab||ij>
+        B = self.double_bar(*np.ix_(virtual,virtual,occupied,occupied)).transpose(2,0,3,1).reshape(nOV,nOV) # + <ab||ij>
 
-        A = A.reshape(nOV,nOV)
-        B = B.reshape(nOV,nOV)
+        if alg == 'hermitian' and nroots is not None:
+            sys.exit("nroots is only supported for alg='reduced' or 'full'. Quitting.")
 
         # doing Hermitian variant
         if alg == 'hermitian':
@@ -341,19 +483,53 @@ class PostSCF(object):
             transition_energies = np.sqrt(transition_energies)
 
         elif alg == 'reduced':
-            H = np.dot(A-B,A+B)
-            transition_energies,transition_densities = np.linalg.eig(H)
+            if nroots is None or 2*nroots >= nOV - 1:
+                H = np.dot(A-B,A+B)
+                transition_energies,transition_densities = np.linalg.eig(H)
+            else:
+                AmB, ApB = A - B, A + B
+                H = LinearOperator((nOV,nOV),dtype=A.dtype,
+                                   matvec=lambda v: np.dot(AmB,np.dot(ApB,v)))
+                # shift-invert about zero, ((A-B)(A+B))^-1 = (A+B)^-1 (A-B)^-1
+                AmB_lu, ApB_lu = lu_factor(AmB), lu_factor(ApB)
+                Hinv = LinearOperator((nOV,nOV),dtype=A.dtype,
+                                      matvec=lambda v: lu_solve(ApB_lu,lu_solve(AmB_lu,v)))
+                # ask for twice the roots so copies of degenerate roots
+                # near the cutoff are converged, then keep the lowest
+                transition_energies,transition_densities = eigs(H,k=2*nroots,
+                    sigma=0,which='LM',OPinv=Hinv,v0=np.random.RandomState(0).rand(nOV))
             transition_energies = np.sqrt(transition_energies)
             idx = transition_energies.argsort()
-            transition_energies = transition_energies[idx].real
+            transition_energies = transition_energies[idx].real[:nroots]
 
         elif alg == 'full':
-            H = np.block([[A,B],[-B.T,-A.T]])
-            transition_energies,transition_densities = np.linalg.eig(H)
-            idx = transition_energies.argsort()
-            transition_energies = transition_energies[idx].real
-            # take positive eigenvalues
-            transition_energies = transition_energies[nOV:]
+            # only nOV roots are positive, so ARPACK needs 2*nroots of them
+            if nroots is None or 2*nroots >= nOV - 1:
+                H = np.block([[A,B],[-B.T,-A.T]])
+                transition_energies,transition_densities = np.linalg.eig(H)
+                idx = transition_energies.argsort()
+                transition_energies = transition_energies[idx].real
+                # take positive eigenvalues
+                transition_energies = transition_energies[nOV:][:nroots]
+            else:
+                H = LinearOperator((2*nOV,2*nOV),dtype=A.dtype,
+                                   matvec=lambda v: np.concatenate([
+                                       np.dot(A,v[:nOV]) + np.dot(B,v[nOV:]),
+                                      -np.dot(B.T,v[:nOV]) - np.dot(A.T,v[nOV:])]))
+                # shift-invert about zero; solving H [x,y] = [u,v] decouples
+                # into (A+B)(x+y) = u-v and (A-B)(x-y) = u+v
+                AmB_lu, ApB_lu = lu_factor(A - B), lu_factor(A + B)
+                def solve(v):
+                    xpy = lu_solve(ApB_lu,v[:nOV] - v[nOV:])
+                    xmy = lu_solve(AmB_lu,v[:nOV] + v[nOV:])
+                    return 0.5*np.concatenate([xpy + xmy, xpy - xmy])
+                Hinv = LinearOperator((2*nOV,2*nOV),dtype=A.dtype,matvec=solve)
+                # roots come in +/- pairs, the largest real 1/omega are the
+                # lowest positive roots; again ask for twice the roots
+                transition_energies,transition_densities = eigs(H,k=2*nroots,
+                    sigma=0,which='LR',OPinv=Hinv,v0=np.random.RandomState(0).rand(2*nOV))
+                transition_energies = transition_energies.real
+                transition_energies = np.sort(transition_energies[transition_energies > 0])[:nroots]
 
         transition_energies *= 27.211399 # to eV
         self.mol.tdhf_omega = transition_energies
@@ -361,9 +537,9 @@ class PostSCF(object):
         print("\nTime-dependent Hartree-Fock (TDHF)")
         print("------------------------------")
         print("Algorithm:        ",alg)
-        print("Matrix shape:     ",len(H))
+        print("Matrix shape:     ",H.shape[0])
         print("2 * nOcc * nVirt: ",2*nOV)
-        for state in range(min(len(A),10)):
+        for state in range(min(len(transition_energies),10)):
             print("TDHF state %2s (eV): %12.4f" % (state+1,self.mol.tdhf_omega[state]))
 
 
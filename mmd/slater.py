@@ -17,6 +17,34 @@ def trailz(i):
         count += 1        # increment count and repeat
     return count
 
+def popcount(x):
+    ''' Returns the number of set bits for each element of uint64 array x,
+        using the branchless SWAR (SIMD within a register) sequence
+    '''
+    x = np.asarray(x,dtype=np.uint64)
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) \
+      + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0f0f0f0f0f0f0f0f)
+    return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+def trailz_array(x):
+    ''' Returns the number of trailing zero bits for each element of uint64
+        array x, i.e. the index of the lowest set bit
+    '''
+    x = np.asarray(x,dtype=np.uint64)
+    return popcount((x & (~x + np.uint64(1))) - np.uint64(1)).astype(np.int64)
+
+def n_between(det,low,high):
+    ''' Returns the number of occupied orbitals in each (single word) det
+        strictly between orbital indices low < high
+    '''
+    one = np.uint64(1)
+    low = np.asarray(low,dtype=np.uint64)
+    high = np.asarray(high,dtype=np.uint64)
+    mask = ((one << high) - one) & ~((one << (low + one)) - one)
+    return popcount(np.asarray(det,dtype=np.uint64) & mask).astype(np.int64)
+
 def common_index(det1,det2,Nint):
     common = []
     ishift = -64
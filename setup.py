@@ -1,8 +1,11 @@
 from setuptools import setup, find_packages
 from setuptools.extension import Extension
+from setuptools.command.build_ext import build_ext
 from Cython.Build import cythonize
 import numpy
 import os
+import shutil
+import tempfile
 
 os.environ["CPPFLAGS"] = os.getenv("CPPFLAGS", "") + "-I" + numpy.get_include() 
 
@@ -10,10 +13,45 @@ my_integrals = [Extension('mmd.integrals.onee',['cython/onee.pyx']),
                 Extension('mmd.integrals.twoe',['cython/twoe.pyx']),
                 Extension('mmd.integrals.grad',['cython/grad.pyx']),
                 Extension('mmd.integrals.fock',['cython/fock.pyx']),
-#                 extra_compile_args=['-fopenmp'],
-#                 extra_link_args=['-fopenmp'])
                 ]
 
+# extensions with prange loops, threaded when the compiler supports OpenMP
+openmp_integrals = ['mmd.integrals.twoe']
+
+class build_ext_openmp(build_ext):
+    """ Adds the compiler's OpenMP flags to openmp_integrals if a test
+        program builds with them, otherwise prange loops just run serially
+    """
+    def build_extensions(self):
+        if self.compiler.compiler_type == 'msvc':
+            compile_args, link_args = ['/openmp'], []
+        else:
+            compile_args, link_args = ['-fopenmp'], ['-fopenmp']
+        if not self.has_openmp(compile_args,link_args):
+            print("OpenMP not available, building serial integrals")
+            compile_args, link_args = [], []
+        for ext in self.extensions:
+            if ext.name in openmp_integrals:
+                ext.extra_compile_args += compile_args
+                ext.extra_link_args += link_args
+        build_ext.build_extensions(self)
+
+    def has_openmp(self,compile_args,link_args):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            source = os.path.join(tmpdir,'test_openmp.c')
+            with open(source,'w') as f:
+                f.write('#include <omp.h>\nint main(void) { return omp_get_max_threads() < 1; }\n')
+            objects = self.compiler.compile([source],output_dir=tmpdir,
+                                            extra_postargs=compile_args)
+            self.compiler.link_executable(objects,'test_openmp',output_dir=tmpdir,
+                                          extra_postargs=link_args)
+            return True
+        except Exception: # CompileError, LinkError
+            return False
+        finally:
+            shutil.rmtree(tmpdir)
+
 setup(
     name='mmd',
     version='0.0.1',
@@ -33,6 +71,7 @@ setup(
                           compiler_directives={'linetrace': True, 'language_level' : '3'}),
 #    ext_modules=cythonize(my_integrals),
     include_dirs=[numpy.get_include()],
+    cmdclass={'build_ext': build_ext_openmp},
     include_package_data = True,
 )
 
@@ -40,3 +40,7 @@ def test_common_index():
     det2 = np.array([0b1110,0b1101,0b11000])
     common = common_index(det1,det2,3)
     assert set(common) == set([1,2,64,66,131,132])
+
+def test_popcount():
+    dets = np.array([0b0,0b111,0b101010,2**63 + 1,2**64 - 1],dtype=np.uint64)
+    assert np.all(popcount(dets) == [0,3,3,2,64])
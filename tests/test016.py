@@ -29,3 +29,48 @@ def test_mp2_spinorbital():
     
     # G16 reference MP2 energy
     assert np.allclose(-5.3545864180140,emp2_spatial)
+
+def test_packed_double_bar():
+    water = """
+    0 1
+    O    0.000000      -0.075791844    0.000000
+    H    0.866811829    0.601435779    0.000000
+    H   -0.866811829    0.601435779    0.000000
+    """
+    mol = Molecule(geometry=water,basis='sto-3g')
+    mol.RHF()
+    postscf = PostSCF(mol)
+
+    # dense <pq||rs> from spatial MO integrals, spin orbitals alternate a/b
+    p = np.arange(mol.norb)
+    P, Q, R, S = np.ix_(p,p,p,p)
+    g = mol.single_bar.real
+    dense = g[P//2,R//2,Q//2,S//2] * ((P%2 == R%2) & (Q%2 == S%2)) \
+          - g[P//2,S//2,Q//2,R//2] * ((P%2 == S%2) & (Q%2 == R%2))
+
+    assert mol.double_bar_packed.size < dense.size//7
+    assert np.allclose(postscf.double_bar(P,Q,R,S),dense)
+
+def test_ao2mo_cached():
+    water = """
+    0 1
+    O    0.000000      -0.075791844    0.000000
+    H    0.866811829    0.601435779    0.000000
+    H   -0.866811829    0.601435779    0.000000
+    """
+    mol = Molecule(geometry=water,basis='sto-3g')
+    mol.RHF()
+    PostSCF(mol)
+    single_bar = mol.single_bar
+
+    # same C, transform is reused
+    PostSCF(mol)
+    assert mol.single_bar is single_bar
+
+    # forced, or after a new SCF, transform is redone
+    PostSCF(mol).ao2mo(force=True)
+    assert mol.single_bar is not single_bar
+    single_bar = mol.single_bar
+    mol.C = -mol.C
+    PostSCF(mol)
+    assert mol.single_bar is not single_bar
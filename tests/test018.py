@@ -25,3 +25,24 @@ def test_cisd():
     
     # G16 reference CISD energy
     assert np.allclose(-75.011223006,mol.ecisd.real)
+
+def test_hamiltonian_matrix_element():
+
+    water = """
+    0 1
+    O    0.000000      -0.075791844    0.000000
+    H    0.866811829    0.601435779    0.000000
+    H   -0.866811829    0.601435779    0.000000
+    """
+    
+    mol = Molecule(geometry=water,basis='sto-3g')
+    mol.RHF()
+    postscf = PostSCF(mol)
+
+    # element-wise Slater-Condon rules agree with the batched build
+    reference_determinant = int(2**mol.nelec - 1)
+    det_list = postscf.single_and_double_determinants(reference_determinant)[:60]
+    H = postscf.build_full_hamiltonian(det_list)
+    for i, det1 in enumerate(det_list):
+        for j, det2 in enumerate(det_list):
+            assert np.allclose(H[i,j],postscf.hamiltonian_matrix_element(det1,det2,1))
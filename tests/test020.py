@@ -48,3 +48,12 @@ def test_tdhf():
     assert np.allclose(mol.tdhf_omega,ref_omega)
     PostSCF(mol).TDHF(alg='full')
     assert np.allclose(mol.tdhf_omega,ref_omega)
+
+    # only the lowest roots, from ARPACK; 3 ends on the lowest triplet and 5
+    # cuts through the next, so every copy of a degenerate root must be found.
+    # 25 is more than half of nOV = 40, where 'full' falls back to dense
+    for nroots in [3,5,10,25]:
+        PostSCF(mol).TDHF(alg='reduced',nroots=nroots)
+        assert np.allclose(mol.tdhf_omega,ref_omega[:nroots])
+        PostSCF(mol).TDHF(alg='full',nroots=nroots)
+        assert np.allclose(mol.tdhf_omega,ref_omega[:nroots])